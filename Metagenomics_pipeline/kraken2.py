@@ -1,7 +1,50 @@
 import os
+import shutil
 import subprocess
 
-def run_kraken2(forward, reverse, base_name, kraken_db, output_dir, threads):
+def preload_kraken_db(kraken_db):
+    # Pull the database files into the page cache once, so every memory-mapped
+    # kraken2 run after this starts classifying without re-reading them from disk;
+    # only the .k2d files are read, as library/ and taxonomy/ could evict them
+    with os.scandir(kraken_db) as it:
+        k2d_paths = sorted(entry.path for entry in it if entry.name.endswith(".k2d") and entry.is_file())
+    if not k2d_paths:
+        return
+
+    if shutil.which("vmtouch"):
+        vmtouch_cmd = ["vmtouch", "-t"] + k2d_paths
+        print("Running vmtouch command:", " ".join(vmtouch_cmd))  # Debug
+        subprocess.run(vmtouch_cmd, check=True, stdout=subprocess.DEVNULL)
+        return
+
+    for k2d_path in k2d_paths:
+        with open(k2d_path, "rb") as f:
+            while f.read(1 << 24):
+                pass
+
+def copy_kraken_db_to_shm(kraken_db, shm_dir="/dev/shm"):
+    # Copy the database files into a RAM-backed tmpfs once, so every kraken2 run
+    # maps them from memory even on a cold page cache; returns the copy's path, or
+    # kraken_db itself when there is no tmpfs or not enough free space on it
+    with os.scandir(kraken_db) as it:
+        k2d_files = [entry for entry in it if entry.name.endswith(".k2d") and entry.is_file()]
+    db_size = sum(entry.stat().st_size for entry in k2d_files)
+    if not os.path.isdir(shm_dir) or shutil.disk_usage(shm_dir).free < db_size:
+        print(f"Not enough space in {shm_dir} for the Kraken2 database, using {kraken_db}")
+        return kraken_db
+
+    shm_db = os.path.join(shm_dir, f"krakendb_{os.getpid()}")
+    os.makedirs(shm_db, exist_ok=True)
+    try:
+        for entry in k2d_files:
+            shutil.copy2(entry.path, os.path.join(shm_db, entry.name))
+    except OSError:
+        shutil.rmtree(shm_db, ignore_errors=True)
+        raise
+    print(f"Copied the Kraken2 database to {shm_db}")
+    return shm_db
+
+def build_kraken2_cmd(forward, reverse, base_name, kraken_db, output_dir, threads, memory_mapping=True):
     kraken_report = os.path.join(output_dir, f"{base_name}_report.txt")
     kraken_output = os.path.join(output_dir, f"{base_name}_kraken.txt")
 
@@ -12,10 +55,18 @@ def run_kraken2(forward, reverse, base_name, kraken_db, output_dir, threads):
         "--output", kraken_output,
     ]
 
+    if memory_mapping:
+        kraken_cmd.append("--memory-mapping")
+
     if reverse:
-        kraken_cmd.extend(["--paired", "--gzip-compressed", forward, reverse])
-    else:
-        kraken_cmd.extend(["--gzip-compressed", forward])
+        kraken_cmd.append("--paired")
+    kraken_cmd.append("--gzip-compressed")
+    kraken_cmd.extend([forward, reverse] if reverse else [forward])
+
+    return kraken_cmd, kraken_report
+
+def run_kraken2(forward, reverse, base_name, kraken_db, output_dir, threads, memory_mapping=True):
+    kraken_cmd, kraken_report = build_kraken2_cmd(forward, reverse, base_name, kraken_db, output_dir, threads, memory_mapping)
 
     print("Running Kraken2 command:", " ".join(kraken_cmd))  # Debug
     subprocess.run(kraken_cmd, check=True)
@@ -1,15 +1,55 @@
+import csv
+import functools
+import hashlib
+import importlib.util
 import pandas as pd
-import random
-from collections import defaultdict
-import plotly.express as px
-import plotly.io as pio
+import itertools
+import json
 import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from .trimmomatic import run_trimmomatic
 from .bowtie2 import run_bowtie2
-from .kraken2 import run_kraken2
-import distinctipy
-import numpy as np
-import matplotlib.pyplot as plt
+from .kraken2 import run_kraken2, preload_kraken_db, copy_kraken_db_to_shm
+
+# Kraken2 reports are named <sample ID>_report.txt
+REPORT_SUFFIX = "_report.txt"
+REPORT_RE = re.compile(r'(.+)_report\.txt$')
+# Parsed reports are cached as <sample ID>_report.txt.parquet
+CACHE_SUFFIX = ".parquet"
+# Merged results are cached as .cache_<key>.parquet, keyed by the reports, metadata and read count
+AGGREGATE_CACHE_PREFIX = ".cache_"
+
+# Samples classified by an earlier run, keyed by sample_fingerprint, so a rerun can skip them
+DONE_MANIFEST = ".done.json"
+
+# Columns of a standard Kraken2 report, in file order
+REPORT_COLUMNS = ['Perc_frag_cover', 'Nr_frag_cover', 'Nr_frag_direct_at_taxon', 'Rank_code', 'NCBI_ID', 'Scientific_name']
+# Percentages have two decimals and read counts fit in 32 bits; repeated rank codes are stored as categories
+REPORT_DTYPES = {
+    'Perc_frag_cover': 'float32', 'Nr_frag_cover': 'int32', 'Nr_frag_direct_at_taxon': 'int32',
+    'Rank_code': 'category', 'NCBI_ID': 'string', 'Scientific_name': 'string'
+}
+SPECIES_RANK_CODES = frozenset({'S', 'S1', 'S2', 'S3'})
+# Host reads are dropped while aggregating, before they reach the merged results
+HOST_SCIENTIFIC_NAME = 'Homo sapiens'
+# Any scientific name containing "virus" counts as a virus; everything else is plotted as bacteria
+VIRUS_RE = re.compile('Virus', re.IGNORECASE)
+
+# Columns of the merged results that the abundance plots never use, and dtypes for the ones they do
+UNPLOTTED_COLUMNS = ('Perc_frag_cover', 'Nr_frag_cover', 'NCBI_ID')
+PLOT_DTYPES = {'Rank_code': 'category', 'SampleID': 'category', 'Nr_frag_direct_at_taxon': 'int32'}
+
+# Fixed colour palette for the abundance plots, cycled when there are more categories than colours
+PALETTE = [
+    '#000000', '#FF0000', '#556B2F', '#ADD8E6', '#6495ED', '#00FF00', '#0000FF', '#FFFF00', '#00FFFF', '#FF00FF',
+    '#C0C0C0', '#808080', '#800000', '#808000', '#008000', '#800080', '#008080', '#000080', '#CD5C5C', '#DAA520',
+    '#FFA500', '#F0E68C', '#ADFF2F', '#2F4F4F', '#E0FFFF', '#4169E1', '#8A2BE2', '#4B0082', '#8B008B', '#EE82EE',
+    '#DA70D6', '#D2691E', '#BC8F8F', '#DDA0DD', '#D8BFD8', '#FF1493', '#8B4513', '#A0522D', '#708090', '#B0C4DE',
+    '#FFFFF0', '#DCDCDC', '#FFEFD5', '#F5DEB3',
+]
+
 def process_sample(forward, reverse, base_name, bowtie2_index, kraken_db, output_dir, threads, run_bowtie, use_precomputed_reports):
     try:
         if not use_precomputed_reports:
@@ -36,7 +76,153 @@ def process_sample(forward, reverse, base_name, bowtie2_index, kraken_db, output
         print(f"Error processing sample {base_name}: {e}")
         return None
 
+def kraken_db_fingerprint(kraken_db):
+    # Names, sizes and modification times of the database files
+    with os.scandir(kraken_db) as it:
+        return sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime) for entry in it if entry.name.endswith(".k2d"))
+
+def sample_fingerprint(forward, reverse, run_bowtie, bowtie2_index, db_fingerprint):
+    # Path, size and modification time of each read file, plus the host depletion settings and the database
+    read_stats = []
+    for reads in (forward, reverse):
+        if reads:
+            stat = os.stat(reads)
+            read_stats.append((os.path.abspath(reads), stat.st_size, stat.st_mtime))
+    bowtie2_index = os.path.abspath(bowtie2_index) if run_bowtie else None
+    return hashlib.sha1(repr((read_stats, run_bowtie, bowtie2_index, db_fingerprint)).encode()).hexdigest()
+
+def load_done_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, DONE_MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}  # First run, or a manifest that cannot be read; every sample is processed again
+
+def save_done_manifest(output_dir, manifest):
+    # Write to a private temporary file first so an interrupted run never leaves a partial manifest
+    manifest_path = os.path.join(output_dir, DONE_MANIFEST)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+def report_is_complete(kraken_report):
+    # kraken2 writes at least the unclassified line, so an empty report is left over from an interrupted run
+    try:
+        return os.path.getsize(kraken_report) > 0
+    except OSError:
+        return False
+
+def process_samples(samples, bowtie2_index, kraken_db, output_dir, threads, run_bowtie, use_precomputed_reports, max_workers=1, force=False,
+                    preload_db=False):
+    """
+    Runs process_sample for several samples concurrently.
+
+    The heavy lifting happens in the Trimmomatic/Bowtie2/Kraken2 subprocesses, so a thread pool is
+    enough to overlap them. The thread budget is split between workers to avoid oversubscribing the CPU,
+    and the Kraken2 database is preloaded into the page cache once before the first sample starts.
+
+    Each new report is parsed into its Parquet cache (see read_species_hits) as soon as its sample finishes,
+    so aggregation overlaps with the samples still running. This is skipped without a Parquet engine,
+    since the parsed rows would have nowhere to go.
+
+    Every sample that succeeds is recorded in DONE_MANIFEST in output_dir, keyed by its read files, the host
+    depletion settings and the database files. A later run skips samples recorded there whose report is still
+    present and not empty, unless force is set.
+
+    Parameters:
+    - samples (list): (forward, reverse, base_name) tuples, one per sample.
+    - threads (int): Total number of threads shared by all concurrently running samples.
+    - max_workers (int): Maximum number of samples processed at the same time. Defaults to 1.
+    - force (bool): Process every sample, even those a previous run already finished. Defaults to False.
+    - preload_db (bool): Classify from a copy of the database's .k2d files in /dev/shm, made once all samples
+      to skip are known and removed when they are done. Defaults to False.
+    - The remaining parameters are passed through to process_sample.
+
+    Returns:
+    - list: Paths to the Kraken2 reports of the samples that succeeded, skipped samples first, then in completion order.
+    """
+    kraken_reports = []
+    if not use_precomputed_reports and samples:
+        manifest = load_done_manifest(output_dir)
+        db_fingerprint = kraken_db_fingerprint(kraken_db)
+        pending = []
+        for sample in samples:
+            forward, reverse, base_name = sample
+            key = sample_fingerprint(forward, reverse, run_bowtie, bowtie2_index, db_fingerprint)
+            kraken_report = os.path.join(output_dir, f"{base_name}_report.txt")
+            if not force and manifest.get(key) == base_name and report_is_complete(kraken_report):
+                print(f"Skipping sample {base_name}: already processed")
+                kraken_reports.append(kraken_report)
+            else:
+                pending.append((key, sample))
+    else:
+        manifest = None
+        pending = [(None, sample) for sample in samples]
+
+    if not pending:
+        return kraken_reports
+
+    max_workers = max(1, min(max_workers, len(pending)))
+    threads_per_sample = max(1, threads // max_workers)
+
+    # Copy the database to /dev/shm only now that there is a sample to classify, or otherwise
+    # warm the page cache once so each memory-mapped kraken2 run skips the database load
+    run_db = kraken_db
+    if not use_precomputed_reports:
+        if preload_db:
+            run_db = copy_kraken_db_to_shm(kraken_db)
+        if run_db == kraken_db:
+            preload_kraken_db(kraken_db)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(process_sample, forward, reverse, base_name, bowtie2_index, run_db, output_dir,
+                                threads_per_sample, run_bowtie, use_precomputed_reports): (key, base_name)
+                for key, (forward, reverse, base_name) in pending
+            }
+            for future in as_completed(futures):
+                kraken_report = future.result()
+                if kraken_report:
+                    kraken_reports.append(kraken_report)
+                    if manifest is not None:
+                        key, base_name = futures[future]
+                        manifest[key] = base_name
+                        save_done_manifest(output_dir, manifest)
+                    # Parse the new report while the other samples are still classifying; with the
+                    # Parquet cache warm, aggregate_kraken_results only has to merge it afterwards
+                    if not use_precomputed_reports and parquet_engine_available():
+                        try:
+                            read_species_hits(kraken_report)
+                        except Exception as e:
+                            print(f"Error parsing {kraken_report}: {e}")
+    finally:
+        if run_db != kraken_db:
+            shutil.rmtree(run_db, ignore_errors=True)
+
+    return kraken_reports
+
+
+
+def find_kraken_reports(kraken_dir):
+    """
+    Lists the Kraken2 reports in a directory in a single scandir pass.
 
+    Parameters:
+    - kraken_dir (str): Path to the directory containing Kraken report files.
+
+    Returns:
+    - list: (sample_id, DirEntry) tuples sorted by sample ID, one per regular <sample ID>_report.txt file.
+    """
+    reports = []
+    with os.scandir(kraken_dir) as it:
+        for entry in it:
+            match = REPORT_RE.match(entry.name)
+            if match and entry.is_file(follow_symlinks=False):
+                reports.append((match.group(1), entry))
+    reports.sort(key=lambda report: report[0])
+    return reports
 
 def generate_sample_ids_csv(kraken_dir):
     """
@@ -50,16 +236,14 @@ def generate_sample_ids_csv(kraken_dir):
     """
     try:
         # Extract sample IDs from Kraken report filenames
-        sample_ids = []
-        for file_name in os.listdir(kraken_dir):
-            if file_name.endswith("_report.txt"):
-                sample_id = '_'.join(file_name.split('_')[:-1])
-                sample_ids.append(sample_id)
-
-        # Save sample IDs to CSV
-        sampleid_df = pd.DataFrame(sample_ids, columns=['Sample_IDs'])
+        sample_ids = [sample_id for sample_id, _ in find_kraken_reports(kraken_dir)]
+
+        # Save sample IDs to CSV; a flat list of names needs no DataFrame
         sampleid_csv_path = os.path.join(kraken_dir, "sample_ids.csv")
-        sampleid_df.to_csv(sampleid_csv_path, index=False)
+        with open(sampleid_csv_path, 'w', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(['Sample_IDs'])
+            writer.writerows([sample_id] for sample_id in sample_ids)
         
         print(f"Sample IDs saved to {sampleid_csv_path}")
         return sampleid_csv_path
@@ -68,18 +252,119 @@ def generate_sample_ids_csv(kraken_dir):
         print(f"Error generating sample_ids.csv: {e}")
         return None
         
-def aggregate_kraken_results(kraken_dir, metadata_file=None, sample_id_df=None, read_count=10):
+@functools.lru_cache(maxsize=None)
+def parquet_engine_available():
+    return any(importlib.util.find_spec(engine) is not None for engine in ("pyarrow", "fastparquet"))
+
+def write_parquet(frame, path, **kwargs):
+    # Write to a private temporary file first so concurrent runs never read a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    frame.to_parquet(tmp_path, index=False, **kwargs)
+    os.replace(tmp_path, path)
+
+def read_species_hits(report_path, report_mtime=None):
+    """
+    Reads the species-level rows (S, S1, S2, S3) of a single Kraken2 report.
+
+    The parsed rows are cached next to the report as Parquet and reused for as long as the cache is
+    newer than the report. Caching is skipped silently when no Parquet engine (pyarrow) is installed.
+
+    Parameters:
+    - report_path (str): Path to a Kraken2 report file.
+    - report_mtime (float, optional): Modification time of the report, if already known from a directory scan.
+
+    Returns:
+    - DataFrame: Species-level rows with the REPORT_COLUMNS columns, before any read count filtering.
+    """
+    cache_path = report_path + CACHE_SUFFIX
+    try:
+        if report_mtime is None:
+            report_mtime = os.path.getmtime(report_path)
+        if os.path.getmtime(cache_path) >= report_mtime:
+            return pd.read_parquet(cache_path)
+    except (OSError, ImportError, ValueError):
+        pass  # No cache yet, no Parquet engine, or an unreadable cache file
+
+    empty_report = pd.DataFrame(columns=REPORT_COLUMNS).astype(REPORT_DTYPES)
+    if os.path.getsize(report_path) == 0:
+        return empty_report  # An empty file cannot be memory-mapped
+    try:
+        report = pd.read_csv(
+            report_path, sep='\t', header=None, names=REPORT_COLUMNS, usecols=range(len(REPORT_COLUMNS)),
+            dtype=REPORT_DTYPES, engine='c', skipinitialspace=True,  # Kraken indents names by rank depth
+            na_filter=False,  # Reports have no missing fields; skip NA-sentinel matching on every value
+            memory_map=True  # Let the parser read straight from the page cache instead of through read() calls
+        )
+    except pd.errors.EmptyDataError:
+        return empty_report
+    report = report[report['Rank_code'].isin(SPECIES_RANK_CODES)].reset_index(drop=True)
+
+    try:
+        write_parquet(report, cache_path)
+    except ImportError:
+        pass
+    except OSError as e:
+        print(f"Could not cache {report_path}: {e}")
+
+    return report
+
+def clear_cache(kraken_dir):
+    """
+    Removes the Parquet caches written by read_species_hits and aggregate_kraken_results from a Kraken report directory.
+
+    Parameters:
+    - kraken_dir (str): Path to the directory containing Kraken report files.
+
+    Returns:
+    - int: Number of cache files removed.
+    """
+    removed = 0
+    with os.scandir(kraken_dir) as it:
+        for entry in it:
+            if entry.name.endswith(REPORT_SUFFIX + CACHE_SUFFIX) or is_aggregate_cache(entry.name):
+                os.remove(entry.path)
+                removed += 1
+    return removed
+
+def is_aggregate_cache(file_name):
+    return file_name.startswith(AGGREGATE_CACHE_PREFIX) and file_name.endswith(CACHE_SUFFIX)
+
+def aggregate_cache_key(reports, metadata, read_count):
+    """
+    Computes the key of a cached aggregation.
+
+    Parameters:
+    - reports (list): (sample_id, DirEntry) tuples as returned by find_kraken_reports.
+    - metadata (DataFrame): Metadata the reports are merged with.
+    - read_count (int): Minimum read count threshold for filtering results.
+
+    Returns:
+    - str: Hex digest over the report names, modification times and sizes, the metadata contents, the read count
+      and the filtered host name.
+    """
+    report_stats = []
+    for _, entry in reports:
+        stat = entry.stat(follow_symlinks=False)
+        report_stats.append((entry.name, stat.st_mtime, stat.st_size))
+
+    key = hashlib.md5(repr((sorted(report_stats), metadata.columns.tolist(), read_count, HOST_SCIENTIFIC_NAME)).encode())
+    key.update(pd.util.hash_pandas_object(metadata, index=False).values.tobytes())
+    return key.hexdigest()
+
+def aggregate_kraken_results(kraken_dir, metadata_file=None, sample_id_df=None, read_count=0):
     """
     Aggregates Kraken results, merging metadata or using sample IDs if metadata is not provided.
+    Host (Homo sapiens) hits are left out of the merged results.
 
     Parameters:
     - kraken_dir (str): Path to the directory containing Kraken report files.
     - metadata_file (str, optional): Path to the metadata CSV file. Defaults to None.
     - sample_id_df (DataFrame, optional): DataFrame of sample IDs. Used if metadata_file is not provided.
-    - read_count (int): Minimum read count threshold for filtering results.
+    - read_count (int): Minimum read count threshold for filtering results. Defaults to 0.
     
     Returns:
-    - str: Path to the generated merged TSV file.
+    - str: Path to the generated merged TSV file. The same rows are also written next to it as merged_kraken.parquet
+      when a Parquet engine is installed.
     """
     try:
         # Load metadata from file first, fall back to sample_id_df if not provided
@@ -94,48 +379,61 @@ def aggregate_kraken_results(kraken_dir, metadata_file=None, sample_id_df=None,
 
         sample_id_col = metadata.columns[0]  # Assume the first column is the sample ID
 
-        # Dictionary to store aggregated results
-        aggregated_results = {}
-
-        # Iterate over each Kraken report file
-        for file_name in os.listdir(kraken_dir):
-            if file_name.endswith("_report.txt"):
-                with open(os.path.join(kraken_dir, file_name), 'r') as f:
-                    for line in f:
-                        fields = line.strip().split('\t')
-                        perc_frag_cover = fields[0]
-                        nr_frag_cover = fields[1]
-                        nr_frag_direct_at_taxon = int(fields[2])
-                        rank_code = fields[3]
-                        ncbi_ID = fields[4]
-                        scientific_name = fields[5]
-                        parts = file_name.split('_')
-                        extracted_part = '_'.join(parts[:-1])
-                        sampleandtaxonid = extracted_part + str(ncbi_ID)
-
-                        # Check if rank code is species-level and meets the read count threshold
-                        if (rank_code == 'S' or rank_code == 'S1' or rank_code == 'S2' or rank_code == 'S3') and nr_frag_direct_at_taxon >= read_count:
-                            if extracted_part in metadata[sample_id_col].unique():
-                                sample_metadata = metadata.loc[metadata[sample_id_col] == extracted_part].iloc[0].to_dict()
-                                aggregated_results[sampleandtaxonid] = {
-                                    'Perc_frag_cover': perc_frag_cover,
-                                    'Nr_frag_cover': nr_frag_cover,
-                                    'Nr_frag_direct_at_taxon': nr_frag_direct_at_taxon,
-                                    'Rank_code': rank_code,
-                                    'NCBI_ID': ncbi_ID,
-                                    'Scientific_name': scientific_name,
-                                    'SampleID': extracted_part,
-                                    **sample_metadata
-                                }
-
-        # Output aggregated results to a TSV file
+        # First matching metadata row wins; compare IDs as strings like the filenames.
+        # Indexed once so every report joins against the same hash index.
+        meta_index = metadata.drop_duplicates(subset=sample_id_col).astype({sample_id_col: str}).set_index(sample_id_col)
+
         merged_tsv_path = os.path.join(kraken_dir, "merged_kraken.tsv")
-        with open(merged_tsv_path, 'w') as f:
-            # Write headers dynamically
-            headers = ['Perc_frag_cover', 'Nr_frag_cover', 'Nr_frag_direct_at_taxon', 'Rank_code', 'NCBI_ID', 'Scientific_name', 'SampleID'] + metadata.columns[1:].tolist()
-            f.write("\t".join(headers) + "\n")
-            for sampleandtaxonid, data in aggregated_results.items():
-                f.write("\t".join(str(data[col]) for col in headers) + "\n")
+        merged_parquet_path = os.path.join(kraken_dir, "merged_kraken" + CACHE_SUFFIX)
+        headers = REPORT_COLUMNS + ['SampleID'] + meta_index.columns.tolist()
+
+        # Skip parsing and merging entirely when nothing changed since a previous run
+        reports = find_kraken_reports(kraken_dir)
+        cache_path = os.path.join(kraken_dir, f"{AGGREGATE_CACHE_PREFIX}{aggregate_cache_key(reports, metadata, read_count)}{CACHE_SUFFIX}")
+        try:
+            cached = pd.read_parquet(cache_path)
+        except (OSError, ImportError, ValueError):
+            cached = None  # No cache for this key, or no Parquet engine
+        if cached is not None:
+            print(f"Using cached aggregation from {cache_path}")
+            cached.to_csv(merged_tsv_path, sep='\t', index=False, lineterminator='\n')
+            try:
+                write_parquet(cached, merged_parquet_path, compression='zstd')
+            except (OSError, ValueError) as e:
+                print(f"Could not write {merged_parquet_path}: {e}")
+            return merged_tsv_path
+
+        # Only the filtered species rows of each report are kept, a small fraction of the reports themselves,
+        # so they are concatenated once and the same frame is written as the TSV and the Parquet copies
+        merged_parts = []
+
+        # Iterate over each Kraken report file, in a stable order across filesystems
+        for extracted_part, entry in reports:
+            if extracted_part not in meta_index.index:
+                continue  # No metadata for this sample, so none of its rows would be kept
+            report = read_species_hits(entry.path, entry.stat(follow_symlinks=False).st_mtime)
+
+            # Keep species-level rows that meet the read count threshold, without the host reads
+            report = report[(report['Nr_frag_direct_at_taxon'] >= read_count) & (report['Scientific_name'] != HOST_SCIENTIFIC_NAME)]
+            if report.empty:
+                continue
+            merged_parts.append(report.assign(SampleID=extracted_part).join(meta_index, on='SampleID', how='inner')[headers])
+
+        merged = pd.concat(merged_parts, ignore_index=True) if merged_parts else pd.DataFrame(columns=headers)
+        merged.to_csv(merged_tsv_path, sep='\t', index=False, lineterminator='\n')
+
+        # Replace any cache from an earlier state of the directory with this one
+        try:
+            write_parquet(merged, merged_parquet_path, compression='zstd')
+            write_parquet(merged, cache_path)
+            with os.scandir(kraken_dir) as it:
+                for entry in it:
+                    if is_aggregate_cache(entry.name) and entry.path != cache_path:
+                        os.remove(entry.path)
+        except ImportError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Could not cache the aggregation of {kraken_dir}: {e}")
 
         return merged_tsv_path
 
@@ -143,124 +441,176 @@ def aggregate_kraken_results(kraken_dir, metadata_file=None, sample_id_df=None,
         print(f"Error aggregating Kraken results: {e}")
         return None
 
-def generate_abundance_plots(merged_tsv_path, top_N):
+@functools.lru_cache(maxsize=4)
+def load_merged_results(merged_tsv_path, mtime):
+    """
+    Loads the merged results for plotting, preferring the Parquet copy written by aggregate_kraken_results.
+
+    Memoized on the path and modification time, so repeated plot calls on an unchanged file skip reading it.
+    The returned DataFrame is shared between calls and must not be modified in place.
+
+    Parameters:
+    - merged_tsv_path (str): Path to the merged TSV file.
+    - mtime (float): Modification time of the merged TSV file.
+
+    Returns:
+    - DataFrame: The plotted columns, with spaces and slashes in column names replaced by underscores.
+    """
+    df = None
+    parquet_path = os.path.splitext(merged_tsv_path)[0] + CACHE_SUFFIX
     try:
-        df = pd.read_csv(merged_tsv_path, sep="\t")
-        df.columns = df.columns.str.replace('/', '_').str.replace(' ', '_')
-        df = df.apply(lambda col: col.map(lambda x: x.strip() if isinstance(x, str) else x))
-        df = df[df['Scientific_name'] != 'Homo sapiens']  # Remove human reads
-
-        # Generate both viral and bacterial abundance plots
-        for focus, filter_str, plot_title in [
-            ('Virus_Type', 'Virus', 'Viral'),
-            ('Bacteria_Type', 'Virus', 'Bacterial')
+        if os.path.getmtime(parquet_path) >= mtime:
+            with open(merged_tsv_path) as f:
+                columns = [c for c in f.readline().rstrip('\n').split('\t') if c not in UNPLOTTED_COLUMNS]
+            df = pd.read_parquet(parquet_path, columns=columns)
+            df = df.astype({c: object for c in df.select_dtypes(include=['string']).columns}).astype(PLOT_DTYPES)
+    except (OSError, ImportError, ValueError):
+        pass  # No Parquet copy, or one older than the TSV
+
+    if df is None:
+        # Only the hit counts and the categorical columns are plotted; repeated codes and IDs are stored as categories.
+        # Scientific_name stays object until after the top-N pick, where ties must keep first-appearance order.
+        df = pd.read_csv(merged_tsv_path, sep="\t", usecols=lambda c: c not in UNPLOTTED_COLUMNS, dtype=PLOT_DTYPES)
+
+    df.columns = df.columns.str.replace(r'[/ ]', '_', regex=True)
+    for c in df.select_dtypes(include=['object']).columns:
+        # Object columns can also hold booleans or mixed values, which the .str accessor rejects
+        if pd.api.types.infer_dtype(df[c], skipna=True) == 'string':
+            df[c] = df[c].str.strip()
+        else:
+            df[c] = df[c].map(lambda x: x.strip() if isinstance(x, str) else x)
+    return df
+
+def render_abundance_plot(grouped_sum, focus, col, plot_title, colordict):
+    """
+    Draws one abundance bar chart and saves it as <plot_title>_Abundance_by_<col>.png.
+
+    Parameters:
+    - grouped_sum (DataFrame): Mean Nr_frag_direct_at_taxon per (focus, col) pair.
+    - focus (str): Column holding the plotted taxa, Virus_Type or Bacteria_Type.
+    - col (str): Metadata column on the x axis.
+    - plot_title (str): Viral or Bacterial.
+    - colordict (dict): Colour of each taxon.
+
+    Returns:
+    - str: Path to the saved image.
+    """
+    # Imported here so runs that never plot skip loading plotly and Kaleido
+    import plotly.graph_objects as go
+
+    n_col = grouped_sum[col].nunique()
+    plot_width = 1100 + 5 * n_col
+    plot_height = 800 + 5 * n_col
+    font_size = max(10, 14 - n_col // 10)
+
+    # One bar trace per taxon, set up the way px.bar(x=col, y=..., color=focus) would, without its DataFrame introspection
+    fig = go.Figure(
+        data=[
+            go.Bar(
+                x=group[col].to_numpy(),
+                y=group['Nr_frag_direct_at_taxon'].to_numpy(),
+                name=target,
+                legendgroup=target,
+                offsetgroup=target,
+                alignmentgroup='True',
+                marker_color=colordict[target],
+                orientation='v'
+            )
+            for target, group in grouped_sum.groupby(focus, sort=False, observed=True)
+        ],
+        layout=dict(
+            xaxis_title_text=col,
+            yaxis_title_text='Nr_frag_direct_at_taxon',
+            legend=dict(title_text=focus, tracegroupgap=0),
+            barmode='relative',
+            title=f"{plot_title} Abundance by {col}"
+        )
+    )
+
+    fig.update_layout(
+        xaxis=dict(tickfont=dict(size=font_size), tickangle=45),
+        yaxis=dict(tickfont=dict(size=font_size)),
+        title=dict(text=f'Average {plot_title} Abundance by {col}', x=0.5, font=dict(size=16)),
+        bargap=0.5,
+        legend=dict(
+            font=dict(size=font_size),
+            x=1,
+            y=1,
+            traceorder='normal',
+            orientation='v',
+            itemwidth=30,
+            itemsizing='constant',
+            itemclick='toggleothers',
+            itemdoubleclick='toggle'
+        ),
+        width=plot_width,
+        height=plot_height
+    )
+
+    # Every export option stays explicit, as Kaleido would otherwise prefer the layout's width and height
+    image_path = f"{plot_title}_Abundance_by_{col}.png"
+    fig.write_image(image_path, format='png', scale=3, width=1920, height=1080)
+    return image_path
+
+def generate_abundance_plots(merged_tsv_path, top_N, kinds=('virus', 'bacteria')):
+    """
+    Saves the viral and/or bacterial abundance plots of a merged TSV file, one image per metadata column.
+
+    Parameters:
+    - merged_tsv_path (str): Path to the merged TSV file.
+    - top_N (int): Plot only the top N most common taxa of each kind; None plots all of them.
+    - kinds (iterable): Which plots to make, 'virus', 'bacteria' or both. Defaults to both.
+      All requested plots are rendered by the same process pool.
+    """
+    try:
+        df = load_merged_results(merged_tsv_path, os.path.getmtime(merged_tsv_path))
+        # Remove human reads; a no-op for files from aggregate_kraken_results, kept for older merged files
+        df = df[df['Scientific_name'] != HOST_SCIENTIFIC_NAME]
+
+        # Arguments of render_abundance_plot, one entry per image
+        plots = []
+
+        # The viral and bacterial plots split the same rows, so match the names once
+        virus_mask = df['Scientific_name'].str.contains(VIRUS_RE, na=False)
+
+        # Generate the requested viral and bacterial abundance plots
+        for kind, focus, focus_mask, plot_title in [
+            ('virus', 'Virus_Type', virus_mask, 'Viral'),
+            ('bacteria', 'Bacteria_Type', ~virus_mask, 'Bacterial')
         ]:
-            if focus == 'Bacteria_Type':
-                df_focus = df[~df['Scientific_name'].str.contains(filter_str, case=False, na=False)]
-            else:
-                df_focus = df[df['Scientific_name'].str.contains(filter_str, case=False, na=False)]
+            if kind not in kinds:
+                continue
+            df_focus = df[focus_mask]
+            if df_focus.empty:
+                continue  # No hits for this focus, skip the plotting and image export entirely
             df_focus = df_focus.rename(columns={'Scientific_name': focus})
 
             if top_N:
                 top_N_categories = df_focus[focus].value_counts().head(top_N).index
                 df_focus = df_focus[df_focus[focus].isin(top_N_categories)]
 
-            categorical_cols = df_focus.select_dtypes(include=['object']).columns.tolist()
+            categorical_cols = df_focus.select_dtypes(include=['object', 'category']).columns.tolist()
             categorical_cols.remove(focus)
+            # Group on integer category codes rather than hashing Python strings
+            df_focus = df_focus.astype({c: 'category' for c in [focus] + categorical_cols})
+
+            # Create a color mapping based on unique values in the 'focus' column, shared by every column's plot
+            colordict = dict(zip(df_focus[focus].cat.categories, itertools.cycle(PALETTE)))
 
             for col in categorical_cols:
-                grouped_sum = df_focus.groupby([focus, col])['Nr_frag_direct_at_taxon'].mean().reset_index()
-                # Create a color mapping based on unique values in the 'focus' column
-                #colordict = dict(zip(grouped_sum[focus].unique(), distinctipy.get_colors(len(grouped_sum[focus].unique()))))
-                colordict = defaultdict(int)
-                random_colors0 = ["#{:06X}".format(random.randint(0, 0xFFFFFF)) for _ in range(len(grouped_sum[focus].unique()))]
-                #random_colors = ['#{:06x}'.format(random.randint(000000, 0xffff00)) for _ in range(len(grouped_sum[focus].unique()))]
-                random_colors1 =['#000000','#FF0000','#556B2F','#ADD8E6','#6495ED','#00FF00','#0000FF','#FFFF00','#00FFFF','#FF00FF','#C0C0C0','#808080','#800000','#808000','#008000','#800080',
-'#008080','#000080','#CD5C5C','#DAA520','#FFA500','#F0E68C','#ADFF2F','#2F4F4F','#E0FFFF','#4169E1','#8A2BE2','#4B0082','#8B008B','#EE82EE','#DA70D6','#D2691E','#BC8F8F','#800080','#DDA0DD','#D8BFD8','#FF1493','#8B4513','#A0522D','#708090','#B0C4DE','#FFFFF0','#DCDCDC','#FFEFD5','#F5DEB3']              #for target, color in zip(grouped_sum[focus].unique(), random_colors):
-                if (len(grouped_sum[focus].unique())<=len(random_colors1)):
-                  for target, color in zip(grouped_sum[focus].unique(), random_colors1[:len(grouped_sum[focus].unique())]):
-                    colordict[target] = color
-                else :
-                  for target, color in zip(grouped_sum[focus].unique(), random_colors0):
-                    colordict[target] = color
-               
-                #colordict=distinctipy.get_colors(len(grouped_sum[col].unique()))
-                #colordict = dict(zip(grouped_sum[focus].unique(), distinctipy.get_colors(len(grouped_sum[focus].unique()))))
-                # Generate a unique color for each unique item in the 'focus' column
-                #random_colors = distinctipy.get_colors(len(grouped_sum[col].unique()))
-                #colordict = {focus: color for category, color in zip(grouped_sum[col].unique(), random_colors)}
-                def color_distance(c1, c2):
-                  return np.sqrt(sum((a - b) ** 2 for a, b in zip(c1, c2)))
-
-                # Function to generate colors with a minimum distance
-               # Function to generate unique colors with a minimum distance
-                def generate_distant_colors(num_colors, min_distance=30):
-                   colors = []
-                   seen_colors = set()  # To track already generated colors in tuple format
-                   while len(colors) < num_colors:
-                      new_color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-        
-                       # Check if the new color is sufficiently distant and not already seen
-                      if all(color_distance(new_color, existing) >= min_distance for existing in colors) and new_color not in seen_colors:
-                         colors.append(new_color)
-                         seen_colors.add(new_color)  # Add the new color to the set
-                   # Convert RGB colors to hex format
-                   hex_colors = [f"#{r:02x}{g:02x}{b:02x}" for r, g, b in colors]
-                   return hex_colors
-                #num_categories = len(grouped_sum[focus].unique())
-                # Generate distinct colors for each category
-               # colors = generate_distant_colors(num_categories, min_distance=90)
-                #colors = base_colors[:len(unique_targets)]
-                #colors = plt.get_cmap('tab20').colors 
-                #colordict = dict(zip(grouped_sum[focus].unique(), colors))
-                # Generate colors using 'tab20' colormap
-                #colors = plt.get_cmap('tab20').colors
-
-                  # Ensure there are enough colors for unique items in grouped_sum[focus]
-                #unique_targets = grouped_sum[focus].unique()
-                #if len(unique_targets) > len(base_colors):
-                  #raise ValueError("Not enough unique colors in 'tab20' colormap for the number of unique targets.")
-                  #colors = plt.get_cmap('tab20')(np.linspace(0, 1, len(unique_targets)))
-                #else:
-                # Use base 'tab20' colors if they are sufficient
-                 # colors = base_colors[:len(unique_targets)]
-                 # Map each unique target to a color from the colormap
-                #olordict = dict(zip(grouped_sum[focus].unique(), colors[:len(unique_targets)]))
-                plot_width = 1100 + 5 * len(grouped_sum[col].unique())
-                plot_height = 800 + 5 * len(grouped_sum[col].unique())
-                font_size = max(10, 14 - len(grouped_sum[col].unique()) // 10)
-
-                fig = px.bar(
-                    grouped_sum,
-                    x=col,
-                    y='Nr_frag_direct_at_taxon',
-                    color=focus,
-                    color_discrete_map=colordict,
-                    title=f"{plot_title} Abundance by {col}"
-                )
-
-                fig.update_layout(
-                    xaxis=dict(tickfont=dict(size=font_size), tickangle=45),
-                    yaxis=dict(tickfont=dict(size=font_size)),
-                    title=dict(text=f'Average {plot_title} Abundance by {col}', x=0.5, font=dict(size=16)),
-                    bargap=0.5,
-                    legend=dict(
-                        font=dict(size=font_size),
-                        x=1,
-                        y=1,
-                        traceorder='normal',
-                        orientation='v',
-                        itemwidth=30,
-                        itemsizing='constant',
-                        itemclick='toggleothers',
-                        itemdoubleclick='toggle'
-                    ),
-                    width=plot_width,
-                    height=plot_height
-                )
-
-                fig.write_image(f"{plot_title}_Abundance_by_{col}.png", format='png', scale=3,width=1920, height=1080)
-           
+                grouped_sum = df_focus.groupby([focus, col], observed=True)['Nr_frag_direct_at_taxon'].mean().reset_index()
+                if grouped_sum.empty:
+                    continue  # Column is empty for every hit
+                plots.append((grouped_sum, focus, col, plot_title, colordict))
+
+        # Each worker builds and exports its figures through its own Kaleido process, so they render in parallel.
+        # Only the small per-column means are sent to the workers, and no more workers start than there are CPUs,
+        # since every one of them launches its own Chromium.
+        if plots:
+            with ProcessPoolExecutor(max_workers=min(8, len(plots), os.cpu_count() or 1)) as executor:
+                futures = [executor.submit(render_abundance_plot, *plot) for plot in plots]
+                for future in futures:
+                    future.result()
 
     except Exception as e:
         print(f"Error generating abundance plots: {e}")
@@ -0,0 +1,165 @@
+import os
+import re
+import fnmatch
+import argparse
+import pandas as pd
+import sys
+import stat
+import atexit
+from Metagenomics_pipeline.kraken_abundance_pipeline import process_samples, aggregate_kraken_results, generate_abundance_plots, find_kraken_reports
+import logging
+import logging.handlers
+
+# Configure logging; records are written to stderr in batches, and at once from WARNING up
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+log_handler = logging.handlers.MemoryHandler(capacity=200, flushLevel=logging.WARNING, target=stream_handler)
+logging.getLogger().addHandler(log_handler)
+logging.getLogger().setLevel(logging.INFO)
+atexit.register(log_handler.flush)
+
+# Read 1 marker and optional extension at the end of an R1 file name; what precedes it is the sample ID
+R1_SUFFIX_RE = re.compile(r'(_R1_001|_R1|R1_001|R1)(\.fastq(\.gz)?)?$')
+
+def sample_id_from_r1(path):
+    """
+    Strip the read 1 marker and the FASTQ extension from an R1 file name.
+    """
+    return R1_SUFFIX_RE.sub('', os.path.basename(path))
+
+# Read 2 file names tried for a sample ID, in order of preference
+R2_NAME_PATTERNS = [
+    "{}_R2_001.fastq.gz", "{}_R2_001.fastq", "{}_R2.fastq.gz", "{}_R2.fastq",
+    "{}R2_001.fastq.gz", "{}R2_001.fastq", "{}R2.fastq.gz", "{}R2.fastq",
+]
+
+def find_mate(entries, base_name):
+    """
+    Find the R2 file that goes with a sample ID among the scanned directory entries, or None if there is none.
+    """
+    return next((entries[name].path for name in (p.format(base_name) for p in R2_NAME_PATTERNS) if name in entries), None)
+
+def discover_samples(input_dir):
+    """
+    Scan the input directory once for R1 files, returning (forward, reverse, base_name) for each.
+
+    The scandir entries are kept by name, so finding each R2 mate is a dict lookup instead of a stat call.
+    Samples come largest R1 file first, so the longest jobs start first when several run in parallel.
+    """
+    with os.scandir(input_dir) as it:
+        # Hidden files such as macOS AppleDouble ._<name> files are skipped, as glob did
+        entries = {entry.name: entry for entry in it if not entry.name.startswith('.') and entry.is_file()}
+    r1_names = [name for name in entries if fnmatch.fnmatch(name, "*_R1*.fastq*")]
+    r1_names.sort(key=lambda name: (-entries[name].stat().st_size, name))
+    discovered = []
+    for name in r1_names:
+        # Remove suffixes to get the sample ID
+        base_name = sample_id_from_r1(name)
+        discovered.append((entries[name].path, find_mate(entries, base_name), base_name))
+    return discovered
+
+def require_paths(paths):
+    """
+    Stat each (path, kind, description) once, where kind is "dir" or "file", and exit if one is missing or of the wrong kind.
+    """
+    for path, kind, description in paths:
+        try:
+            mode = os.stat(path).st_mode
+        except OSError:
+            mode = 0
+        if not (stat.S_ISDIR(mode) if kind == "dir" else stat.S_ISREG(mode)):
+            logging.error(f"{description} '{path}' not found.")
+            sys.exit(1)
+
+def create_sample_id_df(sample_ids):
+    """
+    Create a DataFrame with the sample IDs taken from the input FASTQ file names.
+    """
+    sample_id_df = pd.DataFrame(sample_ids, columns=["Sample_IDs"])
+    return sample_id_df
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline for Trimmomatic trimming, Bowtie2 host depletion (optional), and Kraken2 taxonomic classification.")
+    parser.add_argument("--kraken_db", required=True, help="Path to Kraken2 database.")
+    parser.add_argument("--bowtie2_index", help="Path to Bowtie2 index (optional).")
+    parser.add_argument("--output_dir", required=True, help="Directory to save output files.")
+    parser.add_argument("--input_dir", required=True, help="Directory containing input FASTQ files.")
+    parser.add_argument("--threads", type=int, default=8, help="Number of threads to use.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of samples to process in parallel; --threads is shared between them. Kraken2 is memory-heavy, so choose it with the database size in mind.")
+    parser.add_argument("--metadata_file", help="Path to the metadata CSV file (optional).")
+    parser.add_argument("--no_metadata", action='store_true', help="Use sample IDs as metadata instead of a metadata file.")
+    parser.add_argument("--read_count", type=int, default=0, help="Minimum read count threshold.")
+    parser.add_argument("--top_N", type=int, default=None, help="Select the top N most common viruses or bacteria.")
+    #parser.add_argument("--filt_virus", required=False,type=None, default=None, help="Select a virus to exclude.")
+    #parser.add_argument("--filt_bact", required=False,type=None, default=None, help="Select a bacteria to exclude.")
+    parser.add_argument("--no_bowtie2", action='store_true', help="Skip Bowtie2 host depletion.")
+    parser.add_argument("--bacteria", action='store_true', help="Generate bacterial abundance plots.")
+    parser.add_argument("--virus", action='store_true', help="Generate viral abundance plots.")
+    parser.add_argument("--use_precomputed_reports", action='store_true', help="Use precomputed Kraken reports instead of running Kraken2.")
+    parser.add_argument("--preload_db", action='store_true', help="Copy the Kraken2 database to /dev/shm once and classify every sample from that copy.")
+    parser.add_argument("--force", action='store_true', help="Process every sample again, even those a previous run already finished.")
+    
+    args = parser.parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # Check every input up front, before any sample is processed
+    if not args.no_metadata and not args.metadata_file:
+        raise ValueError("Metadata file must be provided if --no_metadata is not specified.")
+    required = [(args.kraken_db, "dir", "Kraken database directory")]
+    if not args.use_precomputed_reports:
+        required.append((args.input_dir, "dir", "Input directory"))
+    if not args.no_metadata:
+        required.append((args.metadata_file, "file", "Metadata file"))
+    require_paths(required)
+
+    run_bowtie = not args.no_bowtie2 and args.bowtie2_index is not None
+
+    if args.use_precomputed_reports:
+        # The reports are already in the output directory, so no FASTQ file is read and no tool is run
+        logging.info("Using precomputed Kraken reports; skipping classification.")
+        sample_ids = [sample_id for sample_id, _ in find_kraken_reports(args.output_dir)]
+    else:
+        # One directory scan serves both the processing and the sample IDs used as metadata
+        discovered = discover_samples(args.input_dir)
+        sample_ids = sorted(base_name for _, _, base_name in discovered)
+
+        samples = []
+        for forward, reverse, base_name in discovered:
+            if reverse:
+                logging.info(f"Processing sample {base_name} with paired files.")
+                samples.append((forward, reverse, base_name))
+            else:
+                logging.warning(f"No matching R2 file found for {base_name}. Skipping.")
+
+        # Show the sample list before the tools start writing their own output
+        log_handler.flush()
+        process_samples(samples, args.bowtie2_index, args.kraken_db, args.output_dir, args.threads, run_bowtie,
+                        args.use_precomputed_reports, max_workers=args.jobs, force=args.force,
+                        preload_db=args.preload_db)
+
+    # Metadata handling and abundance plot generation logic remains the same...
+       # Load metadata or create sample ID DataFrame
+    if args.no_metadata:
+        sample_id_df = create_sample_id_df(sample_ids)
+        logging.info("Using sample IDs as metadata.")
+        sample_id_df.to_csv(os.path.join(args.output_dir, "sample_ids.csv"), index=False, lineterminator="\n")
+        merged_tsv_path = aggregate_kraken_results(args.output_dir, sample_id_df=sample_id_df, read_count=args.read_count)
+    else:
+        merged_tsv_path = aggregate_kraken_results(args.output_dir, metadata_file=args.metadata_file, read_count=args.read_count)
+
+
+
+    # Generate abundance plots based on provided flags
+    if merged_tsv_path and os.path.isfile(merged_tsv_path):
+        # With both flags, one call renders the viral and bacterial plots in the same process pool
+        plot_kinds = [kind for kind, wanted in [("virus", args.virus), ("bacteria", args.bacteria)] if wanted]
+        if plot_kinds:
+            logging.info(f"Generating {' and '.join(plot_kinds)} abundance plots.")
+            generate_abundance_plots(merged_tsv_path, args.top_N, kinds=plot_kinds)
+        else:
+            logging.warning("No plot type specified. Use --virus or --bacteria to generate plots.")
+
+     
+
+if __name__ == "__main__":
+    main()
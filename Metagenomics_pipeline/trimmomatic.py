@@ -1,7 +1,8 @@
 import os
+import shutil
 import subprocess
 
-def run_trimmomatic(forward, reverse, base_name, output_dir, threads):
+def build_trimmomatic_cmd(forward, reverse, base_name, output_dir, threads):
     trimmed_forward = os.path.join(output_dir, f"{base_name}_trimmed_R1.fastq.gz")
     trimmed_reverse = os.path.join(output_dir, f"{base_name}_trimmed_R2.fastq.gz")
     unpaired_forward = os.path.join(output_dir, f"{base_name}_unpaired_R1.fastq.gz")
@@ -16,14 +17,70 @@ def run_trimmomatic(forward, reverse, base_name, output_dir, threads):
             "LEADING:3", "TRAILING:3", "SLIDINGWINDOW:4:15", "MINLEN:36"
         ]
     else:
-        trimmed_forward = os.path.join(output_dir, f"{base_name}_trimmed_R1.fastq.gz")
         trimmomatic_cmd = [
             "trimmomatic", "SE", "-threads", str(threads),
             forward, trimmed_forward,
             "LEADING:3", "TRAILING:3", "SLIDINGWINDOW:4:15", "MINLEN:36"
         ]
 
-    print("Running Trimmomatic command:", " ".join(trimmomatic_cmd))  # Debug
-    subprocess.run(trimmomatic_cmd, check=True)
-    
-    return trimmed_forward, trimmed_reverse if reverse else None
+    return trimmomatic_cmd, trimmed_forward, trimmed_reverse if reverse else None
+
+def run_with_pigz(trimmomatic_cmd, inputs, trimmed, threads, pigz):
+    # Trimmomatic (de)compresses .gz files on a single thread, so every .gz input is
+    # decompressed and every .gz output compressed by its own pigz process instead,
+    # connected to Trimmomatic through /dev/fd pipes it sees as plain FASTQ files.
+    # Compressing the trimmed reads is the expensive part, so those pigz processes
+    # share the thread budget left after Trimmomatic's own thread; decompression
+    # cannot use more than one thread and the unpaired outputs are small, so the
+    # rest get one each
+    trimmed_threads = str(max(1, (threads - 1) // max(1, len(trimmed))))
+    trimmomatic_cmd = list(trimmomatic_cmd)
+    procs, pass_fds, write_fds = [], [], []
+    try:
+        for i, arg in enumerate(trimmomatic_cmd):
+            if not arg.endswith(".gz"):
+                continue
+            if arg in inputs:
+                proc = subprocess.Popen([pigz, "-dc", "-p", "1", arg], stdout=subprocess.PIPE)
+                fd = proc.stdout.fileno()
+            else:
+                read_fd, fd = os.pipe()
+                write_fds.append(fd)
+                with open(arg, "wb") as out:
+                    pigz_threads = trimmed_threads if arg in trimmed else "1"
+                    proc = subprocess.Popen([pigz, "-c", "-p", pigz_threads], stdin=read_fd, stdout=out)
+                os.close(read_fd)
+            procs.append(proc)
+            pass_fds.append(fd)
+            trimmomatic_cmd[i] = f"/dev/fd/{fd}"
+
+        print("Running Trimmomatic command:", " ".join(trimmomatic_cmd))  # Debug
+        procs.append(subprocess.Popen(trimmomatic_cmd, pass_fds=pass_fds))
+    finally:
+        # Only Trimmomatic may hold the pipe ends, so pigz sees EOF or a broken pipe once it exits
+        for proc in procs:
+            if proc.stdout:
+                proc.stdout.close()
+        for fd in write_fds:
+            os.close(fd)
+
+    for proc in procs:
+        proc.wait()
+    # Trimmomatic is checked first; a pigz process usually only fails because Trimmomatic did
+    failed = next((proc for proc in reversed(procs) if proc.returncode != 0), None)
+    if failed:
+        raise subprocess.CalledProcessError(failed.returncode, failed.args)
+
+def run_trimmomatic(forward, reverse, base_name, output_dir, threads):
+    pigz = shutil.which("pigz")
+    if pigz:
+        # Trimmomatic only trims here, so a single thread keeps up with the pigz processes around it
+        trimmomatic_cmd, trimmed_forward, trimmed_reverse = build_trimmomatic_cmd(forward, reverse, base_name, output_dir, 1)
+        trimmed = {trimmed_forward, trimmed_reverse} - {None}
+        run_with_pigz(trimmomatic_cmd, {forward, reverse}, trimmed, threads, pigz)
+    else:
+        trimmomatic_cmd, trimmed_forward, trimmed_reverse = build_trimmomatic_cmd(forward, reverse, base_name, output_dir, threads)
+        print("Running Trimmomatic command:", " ".join(trimmomatic_cmd))  # Debug
+        subprocess.run(trimmomatic_cmd, check=True)
+
+    return trimmed_forward, trimmed_reverse